@@ -1,15 +1,23 @@
 import os
+import atexit
+import sys
 import json
+import time
 import random
 import logging
+import queue
 import asyncio
+import functools
+import itertools
 from enum import Enum
-from datetime import datetime
-from typing import Dict, List, Tuple, Optional
-from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener
+from typing import Awaitable, Callable, Dict, List, Tuple, Optional
+from operator import attrgetter
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter, TelegramError, TimedOut
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     CallbackQueryHandler,
@@ -20,16 +28,51 @@ from telegram.ext import (
 
 # ==================== تنظیمات اولیه ====================
 TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN") or os.environ.get("TOKEN")
+if not TOKEN:
+    # فایل .env فقط وقتی خوانده می‌شود که توکن در محیط نباشد
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+        TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN") or os.environ.get("TOKEN")
+    except ImportError:
+        pass
 if not TOKEN:
     print("❌ توکن یافت نشد! متغیر محیطی TELEGRAM_BOT_TOKEN را تنظیم کنید.")
     exit(1)
 
+# اگر آدرس عمومی تنظیم شده باشد ربات به‌جای polling با webhook کار می‌کند
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")
+PORT = int(os.environ.get("PORT", "8443"))
+
+if sys.platform != "win32":
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
 REQUIRED_CHANNEL = "@konkorkhabar"
+CHANNEL = REQUIRED_CHANNEL.lstrip('@')
+CHANNEL_CHAT_ID = f"@{CHANNEL}"
+CHANNEL_URL = f"https://t.me/{CHANNEL}"
+JOIN_REQUIRED_TEXT = f"❌ برای پیوستن به بازی باید عضو کانال {REQUIRED_CHANNEL} باشید."
+NOT_MEMBER_TEXT = f"❌ شما هنوز عضو کانال {REQUIRED_CHANNEL} نیستید!"
+CHANNEL_BUTTON = InlineKeyboardButton("📢 جوین شو در کانال", url=CHANNEL_URL)
 BOT_USERNAME = None
 
+# نوشتن لاگ در نخ جداگانه انجام می‌شود تا write روی stderr حلقه رویداد را متوقف نکند
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+# مقدار نامعتبر LOG_LEVEL نباید جلوی اجرای ربات را بگیرد
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+if LOG_LEVEL not in logging.getLevelNamesMapping():
+    LOG_LEVEL = "WARNING"
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    level=LOG_LEVEL,
+    handlers=[QueueHandler(_log_queue)]
 )
 logger = logging.getLogger(__name__)
 
@@ -42,14 +85,45 @@ class Suit(Enum):
 
     @property
     def persian_name(self):
-        return {
-            Suit.HEARTS: "دل",
-            Suit.DIAMONDS: "خشت",
-            Suit.CLUBS: "گیشنیز",
-            Suit.SPADES: "پیک"
-        }[self]
+        return SUIT_PERSIAN[self]
+
+    @property
+    def display(self):
+        return SUIT_DISPLAY[self]
+
+SUIT_PERSIAN = {
+    Suit.HEARTS: "دل",
+    Suit.DIAMONDS: "خشت",
+    Suit.CLUBS: "گیشنیز",
+    Suit.SPADES: "پیک"
+}
+
+# نماد و نام فارسی خال، یک بار ساخته می‌شود
+SUIT_DISPLAY = {suit: f"{suit.value} {SUIT_PERSIAN[suit]}" for suit in Suit}
+
+SUIT_ORDER = (Suit.HEARTS, Suit.DIAMONDS, Suit.CLUBS, Suit.SPADES)
+
+# نام خال در callback_data دکمه‌های انتخاب حکم
+SUIT_BY_NAME = {
+    'hearts': Suit.HEARTS,
+    'diamonds': Suit.DIAMONDS,
+    'clubs': Suit.CLUBS,
+    'spades': Suit.SPADES
+}
+
+# چیدمان دکمه‌های انتخاب حکم: (نام در callback_data، برچسب دکمه)
+TRUMP_KEYBOARD_LAYOUT = tuple(
+    tuple((name, SUIT_BY_NAME[name].display) for name in row)
+    for row in (("hearts", "diamonds"), ("clubs", "spades"))
+)
+
+# اندیس خال‌ها برای کد عددی کارت و ترتیب خال‌ها در دست بازیکن
+SUIT_INDEX = {suit: i for i, suit in enumerate(Suit)}
+_SUIT_SORT_INDEX = {suit: i for i, suit in enumerate(sorted(Suit, key=lambda s: s.value))}
 
 class Rank:
+    __slots__ = ('symbol', 'value', 'persian_name')
+
     def __init__(self, symbol: str, value: int, persian_name: str):
         self.symbol = symbol
         self.value = value
@@ -72,20 +146,27 @@ RANKS = {
 }
 
 class Card:
+    __slots__ = ('suit', 'rank', 'code', 'sort_key', 'label')
+
     def __init__(self, suit: Suit, rank: Rank):
         self.suit = suit
         self.rank = rank
+        # کد عددی کارت: چهار بیت بالا خال و چهار بیت پایین ارزش
+        self.code = (SUIT_INDEX[suit] << 4) | rank.value
+        self.sort_key = (_SUIT_SORT_INDEX[suit] << 4) | (15 - rank.value)
+        # متن نمایشی کارت یک بار ساخته می‌شود (کارت‌ها بین بازی‌ها مشترک هستند)
+        self.label = f"{rank.symbol}{suit.value}"
 
     def __str__(self):
-        return f"{self.rank.symbol}{self.suit.value}"
+        return self.label
 
     def __eq__(self, other):
         if not isinstance(other, Card):
             return False
-        return self.suit == other.suit and self.rank.symbol == other.rank.symbol
+        return self.code == other.code
 
     def __hash__(self):
-        return hash((self.suit.value, self.rank.symbol))
+        return self.code
 
     @property
     def persian_name(self):
@@ -95,7 +176,23 @@ class Card:
     def value(self):
         return self.rank.value
 
+# ۵۲ کارت یک بار ساخته می‌شوند و بین همه بازی‌ها مشترک هستند (کارت‌ها تغییر نمی‌کنند)
+DECK_TEMPLATE: Tuple[Card, ...] = tuple(Card(suit, rank) for suit in SUIT_ORDER for rank in RANKS.values())
+
+@functools.lru_cache(maxsize=100_000)
+def _trick_winner(trump: int, codes: Tuple[int, ...]) -> int:
+    """اندیس کارت برنده یک دور؛ codes کد عددی کارت‌ها به ترتیب بازی و trump اندیس خال حکم است"""
+    leading_suit = codes[0] >> 4
+    # امتیاز هر کارت: بیت ۸ حکم، بیت ۴ هم‌خال دور، چهار بیت پایین ارزش کارت
+    scores = [
+        ((code >> 4 == trump) << 8) | ((code >> 4 == leading_suit) << 4) | (code & 0xF)
+        for code in codes
+    ]
+    return scores.index(max(scores))
+
 class Player:
+    __slots__ = ('user_id', 'full_name', 'cards', 'first_five', 'tricks_won', 'verified', 'position', 'team')
+
     def __init__(self, user_id: int, full_name: str):
         self.user_id = user_id
         self.full_name = full_name
@@ -111,50 +208,111 @@ class Player:
         return self.full_name
 
 class Round:
+    __slots__ = ('player_ids', 'cards', 'leading_suit', 'starting_player_id', 'winner_id')
+
     def __init__(self):
-        self.cards_played: Dict[int, Card] = {}
+        # کارت‌ها و بازیکنان به ترتیب بازی در دو لیست موازی نگه داشته می‌شوند
+        self.player_ids: List[int] = []
+        self.cards: List[Card] = []
+        # اندیس خال اولین کارت دور (بیت‌های بالای Card.code)
+        self.leading_suit: Optional[int] = None
         self.starting_player_id: Optional[int] = None
         self.winner_id: Optional[int] = None
 
     def is_complete(self) -> bool:
-        return len(self.cards_played) == 4
+        return len(self.cards) == 4
+
+    def add_card(self, user_id: int, card: Card):
+        if not self.cards:
+            self.leading_suit = card.code >> 4
+        self.player_ids.append(user_id)
+        self.cards.append(card)
 
 class Game:
-    def __init__(self, game_id: str, creator_id: int):
+    __slots__ = (
+        'game_id', 'short_code', 'creator_id', 'players', '_players_by_id', 'deck',
+        'current_round', 'rounds', 'turn_order', 'turn_index', 'current_turn_index', 'trump_suit',
+        'trump_chooser_id', '_state', '_status_text', 'last_activity', 'player_chat_ids',
+        'winner_team', 'first_round_dealt', 'team0_rounds', 'team1_rounds', 'hand_number',
+        'trump_markup', 'verify_markup', 'lock'
+    )
+
+    def __init__(self, game_id: int, creator_id: int):
         self.game_id = game_id
+        self.short_code = f"{game_id % 1_000_000:06d}"
         self.creator_id = creator_id
         self.players: List[Player] = []
+        self._players_by_id: Dict[int, Player] = {}
         self.deck: List[Card] = []
         self.current_round = Round()
         self.rounds: List[Round] = []
         self.turn_order: List[int] = []
+        self.turn_index: Dict[int, int] = {}
         self.current_turn_index: int = 0
         self.trump_suit: Optional[Suit] = None
         self.trump_chooser_id: Optional[int] = None
-        self.state: str = "waiting"
-        self.created_at = datetime.now()
+        self._state: str = "waiting"
+        self._status_text: Optional[str] = None
+        self.last_activity = time.monotonic()
         self.player_chat_ids: Dict[int, int] = {}
         self.winner_team: Optional[int] = None
         self.first_round_dealt: bool = False
         self.team0_rounds: int = 0
         self.team1_rounds: int = 0
         self.hand_number: int = 1
+        self.trump_markup = InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton(label, callback_data=f"trump:{game_id}:{name}")
+                for name, label in row
+            ]
+            for row in TRUMP_KEYBOARD_LAYOUT
+        ])
+        self.verify_markup = InlineKeyboardMarkup([[
+            CHANNEL_BUTTON,
+            InlineKeyboardButton("🔄 بررسی مجدد", callback_data=f"verify:{game_id}")
+        ]])
+        self.lock = asyncio.Lock()
+
+    def _touch(self):
+        """باطل کردن متن وضعیت کش شده و ثبت زمان آخرین فعالیت"""
+        self._status_text = None
+        self.last_activity = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @state.setter
+    def state(self, value: str):
+        self._state = value
+        self._touch()
 
-    def add_player(self, player: Player) -> bool:
+    def add_player(self, player: Player) -> Tuple[bool, Optional[str]]:
+        if player.user_id in self._players_by_id:
+            return False, "⚠️ شما قبلاً به این بازی پیوسته‌اید!"
         if len(self.players) >= 4:
-            return False
-        if any(p.user_id == player.user_id for p in self.players):
-            return False
+            return False, "❌ ظرفیت این بازی تکمیل شده است (۴ نفر کامل)."
         player.position = len(self.players)
         self.players.append(player)
+        self._players_by_id[player.user_id] = player
         if len(self.players) == 4:
             self._assign_teams()
-        return True
+        self._touch()
+        return True, None
 
     def remove_player(self, user_id: int):
+        if self._players_by_id.pop(user_id, None) is None:
+            return
         self.players = [p for p in self.players if p.user_id != user_id]
         for i, p in enumerate(self.players):
             p.position = i
+        self._touch()
+
+    def set_verified(self, user_id: int, verified: bool):
+        player = self.get_player(user_id)
+        if player and player.verified != verified:
+            player.verified = verified
+            self._touch()
 
     def _assign_teams(self):
         for i, p in enumerate(self.players):
@@ -169,17 +327,10 @@ class Game:
         return None
 
     def get_player(self, user_id: int) -> Optional[Player]:
-        for p in self.players:
-            if p.user_id == user_id:
-                return p
-        return None
+        return self._players_by_id.get(user_id)
 
     def initialize_deck(self):
-        self.deck = []
-        for suit in [Suit.HEARTS, Suit.DIAMONDS, Suit.CLUBS, Suit.SPADES]:
-            for rank in RANKS.values():
-                self.deck.append(Card(suit, rank))
-        random.shuffle(self.deck)
+        self.deck = random.sample(DECK_TEMPLATE, len(DECK_TEMPLATE))
 
     def deal_first_round(self):
         for i, p in enumerate(self.players):
@@ -187,7 +338,7 @@ class Game:
             end = start + 5
             p.first_five = self.deck[start:end].copy()
             p.cards = p.first_five.copy()
-            p.cards.sort(key=lambda c: (c.suit.value, -c.rank.value))
+            p.cards.sort(key=attrgetter('sort_key'))
         self.first_round_dealt = True
 
     def deal_remaining_cards(self):
@@ -196,9 +347,11 @@ class Game:
             end = start + 8
             remaining_cards = self.deck[start:end].copy()
             p.cards = p.first_five.copy() + remaining_cards
-            p.cards.sort(key=lambda c: (c.suit.value, -c.rank.value))
+            p.cards.sort(key=attrgetter('sort_key'))
 
     def start_game(self) -> bool:
+        if self.state != "waiting":
+            return False
         if len(self.players) != 4:
             return False
         if not all(p.verified for p in self.players):
@@ -210,6 +363,7 @@ class Game:
         self.current_turn_index = 0
         self.state = "choosing_trump"
         self.trump_chooser_id = self.turn_order[0]
+        self._touch()
         return True
 
     def choose_trump(self, user_id: int, suit: Suit) -> bool:
@@ -219,18 +373,19 @@ class Game:
         self.deal_remaining_cards()
         self.state = "playing"
         self.turn_order = [p.user_id for p in self.players]
-        chooser_index = self.turn_order.index(user_id)
-        self.current_turn_index = chooser_index
+        # جای هر بازیکن در ترتیب نوبت برای پیدا کردن نوبت برنده هر دور
+        self.turn_index = {uid: i for i, uid in enumerate(self.turn_order)}
+        self.current_turn_index = self.turn_index[user_id]
+        self._touch()
         return True
 
     def can_play_card(self, player: Player, card: Card) -> bool:
-        if not self.current_round.cards_played:
+        leading_suit = self.current_round.leading_suit
+        if leading_suit is None:
             return True
-        first_card = list(self.current_round.cards_played.values())[0]
-        leading_suit = first_card.suit
-        if card.suit == leading_suit:
+        if card.code >> 4 == leading_suit:
             return True
-        has_leading = any(c.suit == leading_suit for c in player.cards)
+        has_leading = any(c.code >> 4 == leading_suit for c in player.cards)
         return not has_leading
 
     def reset_for_next_hand(self):
@@ -255,6 +410,7 @@ class Game:
         self.current_turn_index = 0
         self.trump_chooser_id = self.turn_order[0]
         self.hand_number += 1
+        self._touch()
 
     def play_card(self, user_id: int, card_index: int) -> Tuple[bool, Optional[Card], Optional[str]]:
         if self.state != "playing":
@@ -269,21 +425,16 @@ class Game:
         card = player.cards[card_index]
 
         if not self.can_play_card(player, card):
-            valid_cards = [c for c in player.cards if self.can_play_card(player, c)]
-            if valid_cards:
-                suits = set()
-                for c in valid_cards:
-                    suits.add(c.suit.persian_name)
-                return False, None, f"❌ باید هم‌خال بازی کنید. خال مجاز: {', '.join(suits)}"
-            else:
-                return False, None, "❌ خطا در بررسی کارت"
+            # کارت رد شده یعنی بازیکن خال زمین را دارد؛ پس تنها خال مجاز همان است
+            leading_card = self.current_round.cards[0]
+            return False, None, f"❌ باید هم‌خال بازی کنید. خال مجاز: {leading_card.suit.persian_name}"
 
         player.cards.pop(card_index)
 
-        if len(self.current_round.cards_played) == 0:
+        if len(self.current_round.cards) == 0:
             self.current_round.starting_player_id = user_id
 
-        self.current_round.cards_played[user_id] = card
+        self.current_round.add_card(user_id, card)
         self.current_turn_index = (self.current_turn_index + 1) % 4
 
         if self.current_round.is_complete():
@@ -306,112 +457,88 @@ class Game:
                 else:
                     self.rounds.append(self.current_round)
                     self.current_round = Round()
-                    winner_index = self.turn_order.index(winner_id)
-                    self.current_turn_index = winner_index
+                    self.current_turn_index = self.turn_index[winner_id]
+        self._touch()
         return True, card, None
 
     def _get_round_winner(self) -> Optional[int]:
-        if not self.current_round.cards_played:
+        if not self.current_round.cards:
             return None
-        
-        first_id = self.current_round.starting_player_id
-        first_card = self.current_round.cards_played[first_id]
-        leading_suit = first_card.suit
-        
-        winner_id = first_id
-        winner_card = first_card
-        
-        for pid, card in self.current_round.cards_played.items():
-            if card.suit == self.trump_suit:
-                if winner_card.suit != self.trump_suit:
-                    winner_id = pid
-                    winner_card = card
-                elif card.value > winner_card.value:
-                    winner_id = pid
-                    winner_card = card
-            elif card.suit == leading_suit and winner_card.suit == leading_suit:
-                if card.value > winner_card.value:
-                    winner_id = pid
-                    winner_card = card
-            elif card.suit == leading_suit and winner_card.suit != self.trump_suit:
-                winner_id = pid
-                winner_card = card
-        return winner_id
+        trump = SUIT_INDEX[self.trump_suit] if self.trump_suit else -1
+        codes = tuple(c.code for c in self.current_round.cards)
+        return self.current_round.player_ids[_trick_winner(trump, codes)]
 
     def get_status_text(self) -> str:
-        text = f"🎮 بازی پاسور - کد: {self.game_id[-6:]}\n\n"
+        """متن وضعیت بازی؛ تا تغییر بعدی وضعیت از کش خوانده می‌شود"""
+        if self._status_text is None:
+            self._status_text = self._build_status_text()
+        return self._status_text
+
+    def _build_status_text(self) -> str:
+        parts: List[str] = [f"🎮 بازی پاسور - کد: {self.short_code}\n\n"]
         
         if self.state == "waiting":
-            text += f"⏳ در انتظار بازیکنان ({len(self.players)}/4)\n\n👥 بازیکنان:\n"
+            parts.append(f"⏳ در انتظار بازیکنان ({len(self.players)}/4)\n\n👥 بازیکنان:\n")
             for p in self.players:
                 status = "✅" if p.verified else "⏳"
-                text += f"• {p.display_name} {status}\n"
+                parts.append(f"• {p.display_name} {status}\n")
             if len(self.players) == 4:
-                text += self._teams_info()
+                parts.append(self._teams_info())
+            return "".join(parts)
+
+        team0_names = " و ".join(p.display_name for p in self.players if p.team == 0)
+        team1_names = " و ".join(p.display_name for p in self.players if p.team == 1)
+        overall = (
+            f"🏆 امتیازات کلی:\n"
+            f"• {team0_names}: {self.team0_rounds} دست\n"
+            f"• {team1_names}: {self.team1_rounds} دست\n"
+            f"🎯 اولین تیم با ۷ دست = برنده نهایی\n"
+        )
                 
-        elif self.state == "choosing_trump":
+        if self.state == "choosing_trump":
             chooser = self.get_player(self.trump_chooser_id)
-            text += "👑 انتخاب حکم\n\n"
-            text += self._teams_info()
-            text += f"\n🎯 انتخاب کننده: {chooser.display_name if chooser else '?'}\n"
-            text += f"📊 دست: {self.hand_number} از ۷\n"
-            text += f"🏆 امتیازات کلی:\n"
-            
-            team0 = [p for p in self.players if p.team == 0]
-            team1 = [p for p in self.players if p.team == 1]
-            team0_names = " و ".join(p.display_name for p in team0)
-            team1_names = " و ".join(p.display_name for p in team1)
-            
-            text += f"• {team0_names}: {self.team0_rounds} دست\n"
-            text += f"• {team1_names}: {self.team1_rounds} دست\n"
-            text += f"🎯 اولین تیم با ۷ دست = برنده نهایی\n\n"
-            text += "📍 لطفاً در پیوی ربات حکم را انتخاب کنید..."
+            parts.append("👑 انتخاب حکم\n\n")
+            parts.append(self._teams_info())
+            parts.append(f"\n🎯 انتخاب کننده: {chooser.display_name if chooser else '?'}\n")
+            parts.append(f"📊 دست: {self.hand_number} از ۷\n")
+            parts.append(overall)
+            parts.append("\n📍 لطفاً در پیوی ربات حکم را انتخاب کنید...")
             
         elif self.state == "playing":
             current = self.get_player(self.turn_order[self.current_turn_index])
-            text += f"🎮 دست: {self.hand_number} از ۷\n"
-            text += f"🃏 حکم این دست: {self.trump_suit.value} {self.trump_suit.persian_name}\n"
-            text += f"🎯 نوبت: {current.display_name if current else '?'}\n\n"
-            
-            team0 = [p for p in self.players if p.team == 0]
-            team1 = [p for p in self.players if p.team == 1]
-            team0_names = " و ".join(p.display_name for p in team0)
-            team1_names = " و ".join(p.display_name for p in team1)
             team0_score = sum(p.tricks_won for p in self.players if p.team == 0)
             team1_score = sum(p.tricks_won for p in self.players if p.team == 1)
+            parts.append(
+                f"🎮 دست: {self.hand_number} از ۷\n"
+                f"🃏 حکم این دست: {self.trump_suit.display}\n"
+                f"🎯 نوبت: {current.display_name if current else '?'}\n\n"
+                f"📊 امتیاز این دست:\n"
+                f"• {team0_names}: {team0_score} امتیاز\n"
+                f"• {team1_names}: {team1_score} امتیاز\n"
+                f"🎯 اولین تیم با ۷ امتیاز = برنده این دست\n\n"
+            )
+            parts.append(overall)
             
-            text += f"📊 امتیاز این دست:\n"
-            text += f"• {team0_names}: {team0_score} امتیاز\n"
-            text += f"• {team1_names}: {team1_score} امتیاز\n"
-            text += f"🎯 اولین تیم با ۷ امتیاز = برنده این دست\n\n"
-            text += f"🏆 امتیازات کلی:\n"
-            text += f"• {team0_names}: {self.team0_rounds} دست\n"
-            text += f"• {team1_names}: {self.team1_rounds} دست\n"
-            text += f"🎯 اولین تیم با ۷ دست = برنده نهایی\n"
-            
-            if self.current_round.cards_played:
-                text += "\n🎴 کارت‌های این دور:\n"
-                for pid, card in self.current_round.cards_played.items():
+            if self.current_round.cards:
+                parts.append("\n🎴 کارت‌های این دور:\n")
+                for pid, card in zip(self.current_round.player_ids, self.current_round.cards):
                     player = self.get_player(pid)
-                    text += f"• {player.display_name if player else '?'}: {card}\n"
+                    parts.append(f"• {player.display_name if player else '?'}: {card}\n")
                     
         elif self.state == "finished":
-            team0 = [p for p in self.players if p.team == 0]
-            team1 = [p for p in self.players if p.team == 1]
-            team0_names = " و ".join(p.display_name for p in team0)
-            team1_names = " و ".join(p.display_name for p in team1)
-            
-            text += "🏆 **بازی تمام شد!**\n\n"
-            text += f"📊 نتیجه نهایی:\n"
-            text += f"• {team0_names}: {self.team0_rounds} دست\n"
-            text += f"• {team1_names}: {self.team1_rounds} دست\n\n"
+            parts.append(
+                "🏆 **بازی تمام شد!**\n\n"
+                f"📊 نتیجه نهایی:\n"
+                f"• {team0_names}: {self.team0_rounds} دست\n"
+                f"• {team1_names}: {self.team1_rounds} دست\n\n"
+            )
             
             if self.team0_rounds >= 7:
-                text += f"🏅 تیم {team0_names} با ۷ دست برنده نهایی بازی شد!\n🎉"
+                parts.append(f"🏅 تیم {team0_names} با ۷ دست برنده نهایی بازی شد!\n🎉")
             elif self.team1_rounds >= 7:
-                text += f"🏅 تیم {team1_names} با ۷ دست برنده نهایی بازی شد!\n🎉"
+                parts.append(f"🏅 تیم {team1_names} با ۷ دست برنده نهایی بازی شد!\n🎉")
                 
-        return text
+        return "".join(parts)
 
     def _teams_info(self) -> str:
         if len(self.players) < 4:
@@ -426,75 +553,161 @@ class Game:
         return text
 
 # ==================== مدیریت بازی‌ها ====================
+# شمارنده از زمان شروع ربات (نانوثانیه) تا دکمه‌های اجرای قبلی به بازی جدید اشاره نکنند
+_game_counter = itertools.count(time.time_ns())
+
+def parse_game_id(raw: str) -> Optional[int]:
+    """تبدیل game_id رشته‌ای (لینک یا callback_data) به عدد"""
+    # isdigit به‌تنهایی ارقام یونیکد مثل '²' را هم می‌پذیرد که int آنها را قبول نمی‌کند
+    return int(raw) if raw.isascii() and raw.isdigit() else None
+
 class GameManager:
     def __init__(self):
-        self.games: Dict[str, Game] = {}
-        self.user_game: Dict[int, str] = {}
+        self.games: Dict[int, Game] = {}
+        self.user_game: Dict[int, int] = {}
 
     def create_game(self, creator_id: int) -> Game:
-        game_id = f"game_{creator_id}_{int(datetime.now().timestamp())}"
+        game_id = next(_game_counter)
         game = Game(game_id, creator_id)
         self.games[game_id] = game
         return game
 
-    def get_game(self, game_id: str) -> Optional[Game]:
+    def get_game(self, game_id: Optional[int]) -> Optional[Game]:
         """دریافت بازی با game_id - بازی تا وقتی تمام نشده یا بسته نشده وجود دارد"""
         return self.games.get(game_id)
 
     def get_user_game(self, user_id: int) -> Optional[Game]:
         gid = self.user_game.get(user_id)
-        return self.games.get(gid) if gid else None
+        return self.games.get(gid) if gid is not None else None
 
-    def set_user_game(self, user_id: int, game_id: str):
+    def set_user_game(self, user_id: int, game_id: int):
         self.user_game[user_id] = game_id
 
     def remove_user_game(self, user_id: int):
-        if user_id in self.user_game:
-            del self.user_game[user_id]
-
-    def delete_game(self, game_id: str):
-        if game_id in self.games:
-            del self.games[game_id]
+        self.user_game.pop(user_id, None)
+
+    def delete_game(self, game_id: int):
+        self.games.pop(game_id, None)
+
+    def purge_stale(self, now: float) -> List[Game]:
+        """حذف بازی‌های رها شده؛ بازی‌های حذف شده را برمی‌گرداند"""
+        stale = [
+            game for game in self.games.values()
+            if now - game.last_activity > (WAITING_GAME_TTL if game.state == "waiting" else GAME_IDLE_TTL)
+        ]
+        for game in stale:
+            for uid in [p.user_id for p in game.players] + [game.creator_id]:
+                if self.user_game.get(uid) == game.game_id:
+                    del self.user_game[uid]
+            self.delete_game(game.game_id)
+        return stale
+
+# بازی در انتظار بازیکن و بازی در جریان بعد از این مدت بی‌فعالیتی رها شده حساب می‌شوند
+WAITING_GAME_TTL = 3600.0
+GAME_IDLE_TTL = 2 * 3600.0
 
 game_manager = GameManager()
 
 # ==================== بررسی عضویت ====================
-async def check_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> Tuple[bool, str]:
+MEMBERSHIP_TTL = 60.0
+_membership_cache: Dict[int, float] = {}
+_inflight_checks: Dict[int, asyncio.Future] = {}
+
+async def _fetch_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> Tuple[bool, str]:
     try:
-        channel = REQUIRED_CHANNEL.lstrip('@')
-        chat = await context.bot.get_chat_member(f"@{channel}", user_id)
-        if chat.status in ['member', 'administrator', 'creator']:
-            return True, "✅ عضویت تایید شد"
-        if chat.status == 'restricted' and hasattr(chat, 'is_member') and chat.is_member:
-            return True, "✅ عضویت تایید شد"
-        return False, "❌ شما عضو کانال نیستید"
-    except Exception as e:
+        chat = await tg_call(lambda: context.bot.get_chat_member(CHANNEL_CHAT_ID, user_id), idempotent=True)
+        is_member = chat.status in ['member', 'administrator', 'creator'] or (
+            chat.status == 'restricted' and getattr(chat, 'is_member', False)
+        )
+    except TelegramError as e:
+        logger.warning("بررسی عضویت %s ناموفق بود: %s", user_id, e)
+        _membership_cache.pop(user_id, None)
         return False, f"❌ خطا در بررسی عضویت"
+    if is_member:
+        _membership_cache[user_id] = time.monotonic()
+        return True, "✅ عضویت تایید شد"
+    _membership_cache.pop(user_id, None)
+    return False, "❌ شما عضو کانال نیستید"
+
+async def check_membership(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> Tuple[bool, str]:
+    # فقط عضویت تاییدشده کش می‌شود تا کاربری که تازه جوین شده منتظر نماند
+    checked_at = _membership_cache.get(user_id)
+    if checked_at is not None and time.monotonic() - checked_at < MEMBERSHIP_TTL:
+        return True, "✅ عضویت تایید شد"
+
+    # کلیک‌های همزمان یک کاربر منتظر همان درخواست در جریان می‌مانند
+    pending = _inflight_checks.get(user_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight_checks[user_id] = future
+    try:
+        result = await _fetch_membership(context, user_id)
+        future.set_result(result)
+        return result
+    finally:
+        _inflight_checks.pop(user_id, None)
+        if not future.done():
+            future.cancel()
+
+async def verify_players(context: ContextTypes.DEFAULT_TYPE, game: Game) -> List[Player]:
+    """بررسی همزمان عضویت بازیکنان (به جز سازنده)؛ بازیکنان تاییدنشده برگردانده می‌شوند"""
+    players = [p for p in game.players if p.user_id != game.creator_id]
+    results = await asyncio.gather(
+        *(check_membership(context, p.user_id) for p in players),
+        return_exceptions=True
+    )
+    for p, result in zip(players, results):
+        game.set_verified(p.user_id, not isinstance(result, BaseException) and result[0])
+    return [p for p in game.players if not p.verified]
 
 # ==================== توابع کمکی ====================
+# سقف درخواست‌های همزمان به تلگرام تا انفجار ارسال‌ها به محدودیت ۳۰ پیام در ثانیه نخورد
+TG_MAX_CONCURRENT = 25
+_tg_semaphore = asyncio.Semaphore(TG_MAX_CONCURRENT)
+
+async def tg_call(make_call: Callable[[], Awaitable], retries: int = 2, idempotent: bool = False):
+    """اجرای درخواست تلگرام؛ در صورت خطای 429 به اندازه retry_after صبر و دوباره تلاش می‌کند"""
+    for attempt in range(retries + 1):
+        try:
+            async with _tg_semaphore:
+                return await make_call()
+        except RetryAfter as e:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(e.retry_after + 0.1)
+        except TimedOut:
+            # پیام ممکن است با وجود timeout تحویل شده باشد؛ فقط ویرایش، حذف و استعلام تکرار می‌شوند
+            if not idempotent or attempt == retries:
+                raise
+            await asyncio.sleep(0.5)
+        except BadRequest as e:
+            # ویرایش بدون تغییر در واقع موفق است
+            if "not modified" in e.message:
+                return None
+            raise
+
 def format_cards(cards: List[Card]) -> str:
     if not cards:
         return "بدون کارت"
-    by_suit = defaultdict(list)
+    # دست بازیکن بر اساس sort_key مرتب است، پس کارت‌های هر خال از قبل به ترتیب ارزش نزولی هستند
+    by_suit: Dict[Suit, List[str]] = {suit: [] for suit in SUIT_ORDER}
     for card in cards:
-        by_suit[card.suit].append(card)
-    lines = []
-    for suit in [Suit.HEARTS, Suit.DIAMONDS, Suit.CLUBS, Suit.SPADES]:
-        if suit in by_suit:
-            suit_cards = by_suit[suit]
-            suit_cards.sort(key=lambda c: -c.rank.value)
-            line = f"\n{suit.persian_name}: " + " ".join(f"{c.rank.symbol}{c.suit.value}" for c in suit_cards)
-            lines.append(line)
-    return "".join(lines)
-
-def make_cards_keyboard(game_id: str, cards: List[Card]) -> Optional[InlineKeyboardMarkup]:
+        by_suit[card.suit].append(card.label)
+    return "".join(
+        f"\n{suit.persian_name}: " + " ".join(labels)
+        for suit, labels in by_suit.items() if labels
+    )
+
+def make_cards_keyboard(game_id: int, cards: List[Card]) -> Optional[InlineKeyboardMarkup]:
     if not cards:
         return None
     keyboard = []
     row = []
     for i, card in enumerate(cards):
         row.append(InlineKeyboardButton(
-            f"{card.rank.symbol}{card.suit.value}",
+            card.label,
             callback_data=f"play:{game_id}:{i}"
         ))
         if len(row) == 4:
@@ -504,6 +717,166 @@ def make_cards_keyboard(game_id: str, cards: List[Card]) -> Optional[InlineKeybo
         keyboard.append(row)
     return InlineKeyboardMarkup(keyboard) if keyboard else None
 
+async def send_cards_message(context: ContextTypes.DEFAULT_TYPE, game: Game, user_id: int,
+                             text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+    """ویرایش پیام کارت‌های قبلی بازیکن؛ اگر پیامی نبود یا ویرایش نشد، پیام جدید ارسال می‌شود"""
+    message_id = game.player_chat_ids.get(user_id)
+    if message_id:
+        try:
+            await tg_call(lambda: context.bot.edit_message_text(
+                text,
+                chat_id=user_id,
+                message_id=message_id,
+                reply_markup=reply_markup
+            ), idempotent=True)
+            return
+        except BadRequest:
+            # پیام قبلی پاک شده یا قابل ویرایش نیست؛ پیام جدید ارسال می‌شود
+            pass
+    msg = await tg_call(lambda: context.bot.send_message(user_id, text, reply_markup=reply_markup))
+    game.player_chat_ids[user_id] = msg.message_id
+
+async def edit_query_text(query, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+    """ویرایش پیام کالبک؛ اگر متن و کیبورد تغییری نکرده باشد درخواستی ارسال نمی‌شود"""
+    message = query.message
+    if message and message.text == text and message.reply_markup == reply_markup:
+        return
+    await tg_call(lambda: query.edit_message_text(text, reply_markup=reply_markup), idempotent=True)
+
+async def send_silently(context: ContextTypes.DEFAULT_TYPE, user_id: int, text: str):
+    try:
+        await tg_call(lambda: context.bot.send_message(user_id, text))
+    except TelegramError as e:
+        logger.warning("ارسال پیام به %s ناموفق بود: %s", user_id, e)
+
+async def _send_one(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str,
+                    reply_markup: Optional[InlineKeyboardMarkup]):
+    return await tg_call(lambda: context.bot.send_message(chat_id, text, reply_markup=reply_markup))
+
+async def send_to_many(context: ContextTypes.DEFAULT_TYPE,
+                       messages: List[Tuple[int, str, Optional[InlineKeyboardMarkup]]]) -> list:
+    """ارسال همزمان پیام به چند بازیکن؛ خطای یک ارسال بقیه را متوقف نمی‌کند"""
+    results = await asyncio.gather(
+        *(_send_one(context, chat_id, text, markup) for chat_id, text, markup in messages),
+        return_exceptions=True
+    )
+    for (chat_id, _, _), result in zip(messages, results):
+        if isinstance(result, BaseException):
+            logger.warning("ارسال پیام به %s ناموفق بود: %s", chat_id, result)
+    return results
+
+async def send_hands(context: ContextTypes.DEFAULT_TYPE, game: Game,
+                     messages: List[Tuple[int, str, Optional[InlineKeyboardMarkup]]]):
+    """ارسال همزمان پیام کارت‌ها و ثبت message_id آنها برای ویرایش‌های بعدی"""
+    results = await send_to_many(context, messages)
+    for (user_id, _, _), msg in zip(messages, results):
+        if not isinstance(msg, BaseException):
+            game.player_chat_ids[user_id] = msg.message_id
+
+CHAT_SEND_INTERVAL = 1.0
+_last_sent_at: Dict[int, float] = {}
+_outbox: Dict[int, Tuple[List[str], asyncio.Future]] = {}
+
+async def send_coalesced(context: ContextTypes.DEFAULT_TYPE, user_id: int, text: str):
+    """ارسال اعلان با فاصله حداقل CHAT_SEND_INTERVAL در هر چت و ادغام اعلان‌های همان فاصله"""
+    entry = _outbox.get(user_id)
+    if entry is not None:
+        entry[0].append(text)
+        await asyncio.shield(entry[1])
+        return
+
+    entry = ([text], asyncio.get_running_loop().create_future())
+    _outbox[user_id] = entry
+    try:
+        delay = _last_sent_at.get(user_id, 0.0) + CHAT_SEND_INTERVAL - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        del _outbox[user_id]
+        _last_sent_at[user_id] = time.monotonic()
+        await tg_call(lambda: context.bot.send_message(user_id, "\n\n".join(entry[0])))
+    except BaseException as e:
+        # هر خطا یا لغوی باید به منتظرها هم برسد تا هیچ‌کدام برای همیشه منتظر نمانند
+        if _outbox.get(user_id) is entry:
+            del _outbox[user_id]
+        error = RuntimeError("ارسال اعلان لغو شد") if isinstance(e, asyncio.CancelledError) else e
+        _fail_outbox_entry(user_id, entry, error)
+        raise
+    entry[1].set_result(None)
+
+def _fail_outbox_entry(user_id: int, entry: Tuple[List[str], asyncio.Future], error: BaseException):
+    logger.warning("%d اعلان برای %s ارسال نشد: %s", len(entry[0]), user_id, error)
+    if not entry[1].done():
+        entry[1].set_exception(error)
+        # اگر منتظری نباشد، خطای future به‌عنوان «بازیابی نشده» گزارش نمی‌شود
+        entry[1].exception()
+
+JANITOR_INTERVAL = 300
+PURGED_GAME_NOTICE = "⌛️ بازی شما به دلیل بی‌فعالیتی طولانی بسته شد. برای بازی جدید از /newgame استفاده کنید."
+
+async def _janitor(application: Application):
+    """پاکسازی دوره‌ای بازی‌های رها شده و کش‌های منقضی"""
+    while True:
+        await asyncio.sleep(JANITOR_INTERVAL)
+        try:
+            now = time.monotonic()
+            purged = game_manager.purge_stale(now)
+            if purged:
+                # Application هم مثل context ویژگی bot را دارد و برای send_to_many کافی است
+                await send_to_many(application, [
+                    (p.user_id, PURGED_GAME_NOTICE, None)
+                    for game in purged for p in game.players
+                ])
+            for user_id, sent_at in list(_last_sent_at.items()):
+                if now - sent_at > CHAT_SEND_INTERVAL:
+                    del _last_sent_at[user_id]
+            for user_id, checked_at in list(_membership_cache.items()):
+                if now - checked_at >= MEMBERSHIP_TTL:
+                    del _membership_cache[user_id]
+        except Exception:
+            logger.exception("خطا در پاکسازی دوره‌ای")
+
+async def start_janitor(application: Application):
+    application.bot_data['janitor'] = asyncio.create_task(_janitor(application))
+
+async def stop_janitor(application: Application):
+    task = application.bot_data.pop('janitor', None)
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+async def delete_silently(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int):
+    try:
+        await tg_call(lambda: context.bot.delete_message(chat_id, message_id), idempotent=True)
+    except (TelegramError, asyncio.TimeoutError):
+        pass
+
+async def announce_join(context: ContextTypes.DEFAULT_TYPE, game: Game, user_id: int,
+                        full_name: str, confirmation: Callable[[], Awaitable]):
+    """اطلاع پیوستن بازیکن به بقیه، همزمان با پیام تایید برای خود او"""
+    count = len(game.players)
+    # پیوستن‌های پشت سر هم در هر چت در یک پیام ادغام می‌شوند
+    chat_ids = [p.user_id for p in game.players if p.user_id != user_id]
+    results = await asyncio.gather(
+        *(send_coalesced(context, chat_id, f"👤 {full_name} به بازی پیوست. ({count}/4)") for chat_id in chat_ids),
+        tg_call(confirmation),
+        return_exceptions=True
+    )
+    for chat_id, result in zip(chat_ids + [user_id], results):
+        if isinstance(result, BaseException):
+            logger.warning("ارسال پیام پیوستن به %s ناموفق بود: %s", chat_id, result)
+
+    if count == 4:
+        creator = game.get_player(game.creator_id)
+        if creator:
+            await tg_call(lambda: context.bot.send_message(
+                creator.user_id,
+                f"✅ بازی کد {game.short_code} تکمیل شد!\n"
+                f"برای شروع از /startgame استفاده کنید."
+            ))
+
 def get_user_full_name(user) -> str:
     if user.username:
         return f"@{user.username}"
@@ -528,7 +901,7 @@ async def private_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         BOT_USERNAME = me.username
 
     if args and args[0].startswith("join_"):
-        game_id = args[0][5:]
+        game_id = parse_game_id(args[0][5:])
         game = game_manager.get_game(game_id)
         if not game:
             await update.message.reply_text(
@@ -537,7 +910,7 @@ async def private_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        if any(p.user_id == user.id for p in game.players):
+        if game.get_player(user.id):
             await update.message.reply_text("⚠️ شما قبلاً به این بازی پیوسته‌اید!")
             return
             
@@ -549,49 +922,32 @@ async def private_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         is_member, msg = await check_membership(context, user.id)
         
         if not is_member:
-            channel = REQUIRED_CHANNEL.lstrip('@')
-            keyboard = [[
-                InlineKeyboardButton("📢 جوین شو در کانال", url=f"https://t.me/{channel}"),
-                InlineKeyboardButton("🔄 بررسی مجدد", callback_data=f"verify:{game.game_id}")
-            ]]
             context.user_data['pending_verify'] = (game.game_id, full_name)
             await update.message.reply_text(
-                f"❌ برای پیوستن به بازی باید عضو کانال {REQUIRED_CHANNEL} باشید.",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                JOIN_REQUIRED_TEXT,
+                reply_markup=game.verify_markup
             )
             return
 
         player = Player(user.id, full_name)
         player.verified = True
-        if game.add_player(player):
+        added, error = game.add_player(player)
+        if added:
             game_manager.set_user_game(user.id, game.game_id)
-            
-            for p in game.players:
-                if p.user_id != user.id:
-                    try:
-                        await context.bot.send_message(
-                            p.user_id,
-                            f"👤 {full_name} به بازی پیوست. ({len(game.players)}/4)"
-                        )
-                    except:
-                        pass
-            
-            await update.message.reply_text(
+            confirmation_text = (
                 f"✅ عضویت شما تأیید شد!\n"
-                f"🎮 به بازی کد {game.game_id[-6:]} پیوستید.\n"
+                f"🎮 به بازی کد {game.short_code} پیوستید.\n"
                 f"👥 بازیکنان: {len(game.players)}/4"
             )
-            
-            if len(game.players) == 4:
-                creator = game.get_player(game.creator_id)
-                if creator:
-                    await context.bot.send_message(
-                        creator.user_id,
-                        f"✅ بازی کد {game.game_id[-6:]} تکمیل شد!\n"
-                        f"برای شروع از /startgame استفاده کنید."
-                    )
+            await announce_join(
+                context,
+                game,
+                user.id,
+                full_name,
+                lambda: update.message.reply_text(confirmation_text)
+            )
         else:
-            await update.message.reply_text("❌ خطا در پیوستن به بازی!")
+            await update.message.reply_text(error)
         return
 
     full_name = get_user_full_name(user)
@@ -622,7 +978,7 @@ async def newgame_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     current_game = game_manager.get_user_game(user.id)
     if current_game and current_game.state == "waiting":
         await update.message.reply_text(
-            f"❌ شما در حال حاضر در بازی کد {current_game.game_id[-6:]} هستید.\n"
+            f"❌ شما در حال حاضر در بازی کد {current_game.short_code} هستید.\n"
             f"لطفاً آن بازی را ترک کنید یا تمام کنید."
         )
         return
@@ -636,7 +992,7 @@ async def newgame_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     invite_link = f"https://t.me/{BOT_USERNAME}?start=join_{game.game_id}"
     await update.message.reply_text(
         f"✅ بازی جدید ایجاد شد!\n"
-        f"🔢 کد بازی: {game.game_id[-6:]}\n\n"
+        f"🔢 کد بازی: {game.short_code}\n\n"
         f"🔗 **لینک دعوت (تا پایان بازی معتبر است):**\n{invite_link}\n\n"
         f"📌 این لینک را برای دوستان خود بفرستید.\n"
         f"⚠️ توجه: لینک تا زمانی که بازی تمام نشده یا بسته نشده معتبر است.\n"
@@ -676,45 +1032,51 @@ async def startgame_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
         
-    if not all(p.verified for p in game.players):
-        await update.message.reply_text("❌ همه بازیکنان عضویت خود را تأیید نکرده‌اند.")
+    not_verified = await verify_players(context, game)
+    if not_verified:
+        names = "\n".join(f"• {p.display_name}" for p in not_verified)
+        await update.message.reply_text(f"❌ همه بازیکنان عضویت خود را تأیید نکرده‌اند:\n{names}")
+        return
+
+    # بررسی عضویت await دارد؛ ممکن است /startgame دیگری در این فاصله بازی را شروع کرده باشد
+    if game.state != "waiting":
+        await update.message.reply_text("⚠️ بازی قبلاً شروع شده است.")
         return
 
     if game.start_game():
+        messages = []
         for player in game.players:
             cards_text = format_cards(player.cards)
             teammate = game.get_teammate(player)
             teammate_text = f"\n🤝 یار شما: {teammate.display_name}" if teammate else ""
-            await context.bot.send_message(
+            messages.append((
                 player.user_id,
                 f"🎴 کارت‌های دور اول{teammate_text}\n\n"
                 f"🃏 ۵ کارت اولیه\n{cards_text}\n\n"
-                f"⏳ منتظر انتخاب حکم..."
-            )
+                f"⏳ منتظر انتخاب حکم...",
+                None
+            ))
+
+        # کارت‌ها و تایید سازنده همزمان؛ پرسش حکم بعد از رسیدن کارت‌ها
+        _, started = await asyncio.gather(
+            send_hands(context, game, messages),
+            tg_call(lambda: update.message.reply_text("✅ بازی شروع شد!")),
+            return_exceptions=True
+        )
+        if isinstance(started, BaseException):
+            logger.warning("ارسال پیام شروع بازی به %s ناموفق بود: %s", user.id, started)
 
         chooser = game.get_player(game.trump_chooser_id)
         if chooser:
-            keyboard = [
-                [
-                    InlineKeyboardButton("♥️ دل", callback_data=f"trump:{game.game_id}:hearts"),
-                    InlineKeyboardButton("♦️ خشت", callback_data=f"trump:{game.game_id}:diamonds")
-                ],
-                [
-                    InlineKeyboardButton("♣️ گیشنیز", callback_data=f"trump:{game.game_id}:clubs"),
-                    InlineKeyboardButton("♠️ پیک", callback_data=f"trump:{game.game_id}:spades")
-                ]
-            ]
-            await context.bot.send_message(
+            await tg_call(lambda: context.bot.send_message(
                 chooser.user_id,
                 f"👑 شما انتخاب کننده حکم هستید!\n\n"
-                f"🔢 کد بازی: {game.game_id[-6:]}\n"
+                f"🔢 کد بازی: {game.short_code}\n"
                 f"{game._teams_info()}\n"
                 f"🏆 امتیازات کلی: تیم ۱ {game.team0_rounds} - {game.team1_rounds} تیم ۲\n"
                 f"👇 لطفاً خال حکم را انتخاب کنید:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-
-        await update.message.reply_text("✅ بازی شروع شد!")
+                reply_markup=game.trump_markup
+            ))
     else:
         await update.message.reply_text("❌ خطا در شروع بازی!")
 
@@ -743,219 +1105,187 @@ async def close_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     for player in game.players:
         if player.user_id != user.id:
-            try:
-                await context.bot.send_message(
-                    player.user_id,
-                    f"❌ بازی کد {game.game_id[-6:]} توسط سازنده بسته شد."
-                )
-            except:
-                pass
+            await send_silently(context, player.user_id, f"❌ بازی کد {game.short_code} توسط سازنده بسته شد.")
         game_manager.remove_user_game(player.user_id)
     game_manager.delete_game(game.game_id)
     await update.message.reply_text("✅ بازی بسته شد.")
 
 # ==================== کالبک‌ها ====================
-async def private_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
+async def _callback_verify(query, context: ContextTypes.DEFAULT_TYPE, rest: str):
     await query.answer()
-    
     user = query.from_user
-    data = query.data
 
-    if data.startswith("verify:"):
-        game_id = data[7:]
-        game = game_manager.get_game(game_id)
-        if not game:
-            await query.edit_message_text(
-                "❌ این بازی وجود ندارد یا قبلاً به اتمام رسیده است.\n"
-                "لطفاً از سازنده بازی بخواهید یک بازی جدید ایجاد کند."
-            )
+    game_id = parse_game_id(rest)
+    game = game_manager.get_game(game_id)
+    if not game:
+        await tg_call(lambda: query.edit_message_text(
+            "❌ این بازی وجود ندارد یا قبلاً به اتمام رسیده است.\n"
+            "لطفاً از سازنده بازی بخواهید یک بازی جدید ایجاد کند."
+        ), idempotent=True)
+        return
+
+    full_name = None
+    if 'pending_verify' in context.user_data:
+        stored_gid, full_name = context.user_data['pending_verify']
+        if stored_gid != game_id:
+            await tg_call(lambda: query.edit_message_text("❌ اطلاعات ناهمخوان است."), idempotent=True)
             return
+    else:
+        full_name = get_user_full_name(user)
 
-        full_name = None
-        if 'pending_verify' in context.user_data:
-            stored_gid, full_name = context.user_data['pending_verify']
-            if stored_gid != game_id:
-                await query.edit_message_text("❌ اطلاعات ناهمخوان است.")
-                return
-        else:
-            full_name = get_user_full_name(user)
-
-        is_member, _ = await check_membership(context, user.id)
-        if is_member:
-            player = Player(user.id, full_name)
-            player.verified = True
-            if game.add_player(player):
-                game_manager.set_user_game(user.id, game.game_id)
-                
-                for p in game.players:
-                    if p.user_id != user.id:
-                        try:
-                            await context.bot.send_message(
-                                p.user_id,
-                                f"👤 {full_name} به بازی پیوست. ({len(game.players)}/4)"
-                            )
-                        except:
-                            pass
-                
-                await query.edit_message_text(
-                    f"✅ عضویت تأیید شد!\n"
-                    f"🎮 به بازی کد {game.game_id[-6:]} پیوستید.\n"
-                    f"👥 بازیکنان: {len(game.players)}/4"
-                )
-                if 'pending_verify' in context.user_data:
-                    context.user_data.pop('pending_verify')
-                if len(game.players) == 4:
-                    creator = game.get_player(game.creator_id)
-                    if creator:
-                        await context.bot.send_message(
-                            creator.user_id,
-                            f"✅ بازی کد {game.game_id[-6:]} تکمیل شد!\n"
-                            f"برای شروع از /startgame استفاده کنید."
-                        )
-            else:
-                await query.edit_message_text("❌ خطا در پیوستن به بازی!")
-        else:
-            channel = REQUIRED_CHANNEL.lstrip('@')
-            keyboard = [[
-                InlineKeyboardButton("📢 جوین شو", url=f"https://t.me/{channel}"),
-                InlineKeyboardButton("🔄 بررسی مجدد", callback_data=f"verify:{game.game_id}")
-            ]]
-            await query.edit_message_text(
-                f"❌ شما هنوز عضو کانال {REQUIRED_CHANNEL} نیستید!",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+    is_member, _ = await check_membership(context, user.id)
+    if is_member:
+        player = Player(user.id, full_name)
+        player.verified = True
+        added, error = game.add_player(player)
+        if added:
+            game_manager.set_user_game(user.id, game.game_id)
+            if 'pending_verify' in context.user_data:
+                context.user_data.pop('pending_verify')
+            confirmation_text = (
+                f"✅ عضویت تأیید شد!\n"
+                f"🎮 به بازی کد {game.short_code} پیوستید.\n"
+                f"👥 بازیکنان: {len(game.players)}/4"
             )
+            await announce_join(
+                context,
+                game,
+                user.id,
+                full_name,
+                lambda: query.edit_message_text(confirmation_text)
+            )
+        else:
+            await tg_call(lambda: query.edit_message_text(error), idempotent=True)
+    else:
+        await edit_query_text(
+            query,
+            NOT_MEMBER_TEXT,
+            reply_markup=game.verify_markup
+        )
 
-    elif data.startswith("trump:"):
-        parts = data.split(":")
-        if len(parts) != 3:
-            await query.answer("❌ خطا در دکمه", show_alert=True)
-            return
-            
-        game_id = parts[1]
-        suit_str = parts[2]
-        game = game_manager.get_game(game_id)
-        
-        if not game:
-            await query.answer("❌ بازی یافت نشد!", show_alert=True)
-            return
-            
-        if user.id != game.trump_chooser_id:
-            await query.answer("❌ فقط انتخاب کننده حکم می‌تواند کلیک کند!", show_alert=True)
-            return
+async def _callback_trump(query, context: ContextTypes.DEFAULT_TYPE, rest: str):
+    user = query.from_user
 
-        suit_map = {
-            'hearts': Suit.HEARTS,
-            'diamonds': Suit.DIAMONDS,
-            'clubs': Suit.CLUBS,
-            'spades': Suit.SPADES
-        }
-        suit = suit_map.get(suit_str)
-        if not suit:
-            await query.answer("❌ خال نامعتبر!", show_alert=True)
-            return
+    parts = rest.split(":")
+    if len(parts) != 2:
+        await query.answer("❌ خطا در دکمه", show_alert=True)
+        return
+
+    game_id = parse_game_id(parts[0])
+    suit_str = parts[1]
+    game = game_manager.get_game(game_id)
+
+    if not game:
+        await query.answer("❌ بازی یافت نشد!", show_alert=True)
+        return
+
+    if user.id != game.trump_chooser_id:
+        await query.answer("❌ فقط انتخاب کننده حکم می‌تواند کلیک کند!", show_alert=True)
+        return
 
+    suit = SUIT_BY_NAME.get(suit_str)
+    if not suit:
+        await query.answer("❌ خال نامعتبر!", show_alert=True)
+        return
+
+    async with game.lock:
         if game.choose_trump(user.id, suit):
-            await query.edit_message_text(
-                f"✅ حکم این دست انتخاب شد: {suit.value} {suit.persian_name}\n"
+            await query.answer(f"✅ حکم: {suit.display}", show_alert=True)
+            await tg_call(lambda: query.edit_message_text(
+                f"✅ حکم این دست انتخاب شد: {suit.display}\n"
                 f"🃏 ۸ کارت جدید اضافه شد...\n\n"
                 f"🏆 امتیازات کلی: تیم ۱ {game.team0_rounds} - {game.team1_rounds} تیم ۲",
                 reply_markup=None
-            )
-            await query.answer(f"✅ حکم: {suit.value} {suit.persian_name}", show_alert=True)
+            ), idempotent=True)
 
+            # پیام ۵ کارت اول هر بازیکن در جا به دست کامل ویرایش می‌شود
+            edits = []
             for player in game.players:
                 cards_text = format_cards(player.cards)
                 teammate = game.get_teammate(player)
                 teammate_text = f"\n🤝 یار شما: {teammate.display_name}" if teammate else ""
                 keyboard = make_cards_keyboard(game.game_id, player.cards)
-
-                if player.user_id in game.player_chat_ids:
-                    try:
-                        await context.bot.delete_message(
-                            player.user_id,
-                            game.player_chat_ids[player.user_id]
-                        )
-                    except:
-                        pass
-
-                msg = await context.bot.send_message(
+                edits.append(send_cards_message(
+                    context,
+                    game,
                     player.user_id,
                     f"🎴 **کارت‌های شما (۵ کارت اول + ۸ کارت جدید)**{teammate_text}\n\n"
-                    f"🃏 حکم این دست: {suit.value} {suit.persian_name}\n"
+                    f"🃏 حکم این دست: {suit.display}\n"
                     f"{cards_text}\n\n"
                     f"🏆 امتیازات کلی: تیم ۱ {game.team0_rounds} - {game.team1_rounds} تیم ۲\n\n"
                     f"🎯 نوبت: {game.get_player(game.turn_order[game.current_turn_index]).display_name}",
                     reply_markup=keyboard
-                )
-                game.player_chat_ids[player.user_id] = msg.message_id
+                ))
+            results = await asyncio.gather(*edits, return_exceptions=True)
+            for player, result in zip(game.players, results):
+                if isinstance(result, BaseException):
+                    logger.warning("ارسال کارت‌های %s ناموفق بود: %s", player.user_id, result)
         else:
             await query.answer("❌ خطا در انتخاب حکم!", show_alert=True)
 
-    # ========== بخش بازی کارت ==========
-    elif data.startswith("play:"):
-        parts = data.split(":")
-        if len(parts) != 3:
-            await query.answer("❌ خطا در دکمه", show_alert=True)
-            return
-            
-        game_id = parts[1]
-        try:
-            card_idx = int(parts[2])
-        except:
-            await query.answer("❌ اندیس کارت نامعتبر", show_alert=True)
-            return
+# ========== بخش بازی کارت ==========
+async def _callback_play(query, context: ContextTypes.DEFAULT_TYPE, rest: str):
+    user = query.from_user
 
-        game = game_manager.get_game(game_id)
-        if not game:
-            await query.answer("❌ بازی یافت نشد!", show_alert=True)
-            return
+    parts = rest.split(":")
+    if len(parts) != 2:
+        await query.answer("❌ خطا در دکمه", show_alert=True)
+        return
+
+    game_id = parse_game_id(parts[0])
+    try:
+        card_idx = int(parts[1])
+    except ValueError:
+        await query.answer("❌ اندیس کارت نامعتبر", show_alert=True)
+        return
+
+    game = game_manager.get_game(game_id)
+    if not game:
+        await query.answer("❌ بازی یافت نشد!", show_alert=True)
+        return
 
+    # با پردازش همزمان آپدیت‌ها، حرکت‌های یک بازی پشت سر هم اجرا می‌شوند تا
+    # پایان دست و شروع دست بعد فقط یک بار و توسط همان حرکت انجام شود
+    async with game.lock:
         success, card, error = game.play_card(user.id, card_idx)
-        
+
         if success and card:
             await query.answer(f"✅ {card}", show_alert=True)
 
             player = game.get_player(user.id)
+            # اعلان‌های این حرکت برای هر بازیکن جمع و در یک پیام ارسال می‌شوند
+            notices: Dict[int, List[str]] = {p.user_id: [] for p in game.players}
             if player:
-                await context.bot.send_message(
-                    user.id,
-                    f"✅ شما کارت {card} را بازی کردید."
-                )
-                
+                notices[user.id].append(f"✅ شما کارت {card} را بازی کردید.")
                 for other in game.players:
                     if other.user_id != user.id:
-                        try:
-                            await context.bot.send_message(
-                                other.user_id,
-                                f"🎴 {player.display_name} کارت بازی کرد:\n"
-                                f"{card}"
-                            )
-                        except:
-                            pass
+                        notices[other.user_id].append(
+                            f"🎴 {player.display_name} کارت بازی کرد:\n"
+                            f"{card}"
+                        )
 
             # آپدیت کارت‌های بازیکن
             if player and player.cards:
                 cards_text = format_cards(player.cards)
                 teammate = game.get_teammate(player)
                 teammate_text = f"\n🤝 یار شما: {teammate.display_name}" if teammate else ""
-                
+
                 keyboard = make_cards_keyboard(game.game_id, player.cards)
-                
-                msg = await context.bot.send_message(
+
+                await send_cards_message(
+                    context,
+                    game,
                     user.id,
                     f"🎴 کارت‌های شما{teammate_text}\n\n"
-                    f"🃏 حکم این دست: {game.trump_suit.value} {game.trump_suit.persian_name}\n"
+                    f"🃏 حکم این دست: {game.trump_suit.display}\n"
                     f"{cards_text}\n\n"
                     f"🏆 امتیازات کلی: تیم ۱ {game.team0_rounds} - {game.team1_rounds} تیم ۲\n\n"
                     f"🎯 نوبت: {game.get_player(game.turn_order[game.current_turn_index]).display_name}",
                     reply_markup=keyboard
                 )
-                
-                game.player_chat_ids[user.id] = msg.message_id
 
             # اعلام برنده دور
-            if len(game.current_round.cards_played) == 0 and game.current_round.winner_id:
+            if len(game.current_round.cards) == 0 and game.current_round.winner_id:
                 winner = game.get_player(game.current_round.winner_id)
                 if winner:
                     team0 = [p for p in game.players if p.team == 0]
@@ -964,32 +1294,25 @@ async def private_callback_handler(update: Update, context: ContextTypes.DEFAULT
                     team1_names = " و ".join(p.display_name for p in team1)
                     team0_score = sum(p.tricks_won for p in game.players if p.team == 0)
                     team1_score = sum(p.tricks_won for p in game.players if p.team == 1)
-                    
+
                     for p in game.players:
-                        await context.bot.send_message(
-                            p.user_id,
+                        notices[p.user_id].append(
                             f"🏆 برنده این دور: {winner.display_name}\n\n"
                             f"📊 امتیازات این دست:\n"
                             f"• {team0_names}: {team0_score}\n"
                             f"• {team1_names}: {team1_score}\n"
                             f"🎯 اولین تیم با ۷ امتیاز = برنده این دست"
                         )
-                        
+
                     if game.state == "playing":
                         next_player = game.get_player(game.turn_order[game.current_turn_index])
                         if next_player:
                             for p in game.players:
                                 if p.user_id != next_player.user_id:
-                                    await context.bot.send_message(
-                                        p.user_id,
-                                        f"🎯 نوبت بعدی: {next_player.display_name}"
-                                    )
+                                    notices[p.user_id].append(f"🎯 نوبت بعدی: {next_player.display_name}")
                                 else:
-                                    await context.bot.send_message(
-                                        next_player.user_id,
-                                        f"🎯 نوبت شماست! لطفاً یک کارت بازی کنید."
-                                    )
-            
+                                    notices[p.user_id].append(f"🎯 نوبت شماست! لطفاً یک کارت بازی کنید.")
+
             # اعلام نوبت عادی
             else:
                 if game.state == "playing":
@@ -997,16 +1320,16 @@ async def private_callback_handler(update: Update, context: ContextTypes.DEFAULT
                     if next_player:
                         for p in game.players:
                             if p.user_id != next_player.user_id:
-                                await context.bot.send_message(
-                                    p.user_id,
-                                    f"🎯 نوبت: {next_player.display_name}"
-                                )
+                                notices[p.user_id].append(f"🎯 نوبت: {next_player.display_name}")
                             else:
-                                await context.bot.send_message(
-                                    next_player.user_id,
-                                    f"🎯 نوبت شماست! لطفاً یک کارت بازی کنید."
-                                )
-            
+                                notices[p.user_id].append(f"🎯 نوبت شماست! لطفاً یک کارت بازی کنید.")
+
+            # خطاهای ارسال در send_coalesced ثبت می‌شوند
+            await asyncio.gather(*(
+                send_coalesced(context, p.user_id, "\n\n".join(notices[p.user_id]))
+                for p in game.players if notices[p.user_id]
+            ), return_exceptions=True)
+
             # اعلام برنده دست و شروع دست بعد
             if game.state == "hand_finished":
                 team0 = [p for p in game.players if p.team == 0]
@@ -1015,126 +1338,120 @@ async def private_callback_handler(update: Update, context: ContextTypes.DEFAULT
                 team1_names = " و ".join(p.display_name for p in team1)
                 team0_score = sum(p.tricks_won for p in game.players if p.team == 0)
                 team1_score = sum(p.tricks_won for p in game.players if p.team == 1)
-                
+
                 winner_team = 0 if team0_score >= 7 else 1
                 winner_names = team0_names if winner_team == 0 else team1_names
                 winner_score = team0_score if winner_team == 0 else team1_score
-                
+
                 # اعلام برنده دست به همه
-                for p in game.players:
-                    await context.bot.send_message(
-                        p.user_id,
-                        f"🏆 **دست {game.hand_number} تمام شد!**\n\n"
-                        f"🎯 تیم {winner_names} با {winner_score} امتیاز این دست را برد!\n"
-                        f"📊 امتیازات کلی: تیم ۱ {game.team0_rounds} - {game.team1_rounds} تیم ۲\n\n"
-                        f"🃏 در حال آماده‌سازی دست بعدی..."
-                    )
-                
+                hand_text = (
+                    f"🏆 **دست {game.hand_number} تمام شد!**\n\n"
+                    f"🎯 تیم {winner_names} با {winner_score} امتیاز این دست را برد!\n"
+                    f"📊 امتیازات کلی: تیم ۱ {game.team0_rounds} - {game.team1_rounds} تیم ۲\n\n"
+                    f"🃏 در حال آماده‌سازی دست بعدی..."
+                )
+                await send_to_many(context, [(p.user_id, hand_text, None) for p in game.players])
+
                 # بررسی پایان بازی نهایی
                 if game.team0_rounds >= 7 or game.team1_rounds >= 7:
                     game.state = "finished"
+                    final_names = team0_names if game.team0_rounds >= 7 else team1_names
+                    final_rounds = game.team0_rounds if game.team0_rounds >= 7 else game.team1_rounds
+                    final_text = (
+                        f"🏆 **بازی تمام شد!**\n\n"
+                        f"🎯 تیم {final_names} با {final_rounds} دست به ۷ دست رسیدند!\n"
+                        f"🏅 **برنده نهایی بازی:** {final_names}\n"
+                        f"🎉 تبریک به قهرمانان!\n\n"
+                        f"📊 **نتیجه نهایی:**\n"
+                        f"{team0_names}: {game.team0_rounds} دست\n"
+                        f"{team1_names}: {game.team1_rounds} دست"
+                    )
+                    await send_to_many(context, [(p.user_id, final_text, None) for p in game.players])
                     for p in game.players:
-                        if game.team0_rounds >= 7:
-                            await context.bot.send_message(
-                                p.user_id,
-                                f"🏆 **بازی تمام شد!**\n\n"
-                                f"🎯 تیم {team0_names} با {game.team0_rounds} دست به ۷ دست رسیدند!\n"
-                                f"🏅 **برنده نهایی بازی:** {team0_names}\n"
-                                f"🎉 تبریک به قهرمانان!\n\n"
-                                f"📊 **نتیجه نهایی:**\n"
-                                f"{team0_names}: {game.team0_rounds} دست\n"
-                                f"{team1_names}: {game.team1_rounds} دست"
-                            )
-                        elif game.team1_rounds >= 7:
-                            await context.bot.send_message(
-                                p.user_id,
-                                f"🏆 **بازی تمام شد!**\n\n"
-                                f"🎯 تیم {team1_names} با {game.team1_rounds} دست به ۷ دست رسیدند!\n"
-                                f"🏅 **برنده نهایی بازی:** {team1_names}\n"
-                                f"🎉 تبریک به قهرمانان!\n\n"
-                                f"📊 **نتیجه نهایی:**\n"
-                                f"{team0_names}: {game.team0_rounds} دست\n"
-                                f"{team1_names}: {game.team1_rounds} دست"
-                            )
                         game_manager.remove_user_game(p.user_id)
                     game_manager.delete_game(game.game_id)
                     return
-                
+
                 # ریست برای دست بعدی
                 game.reset_for_next_hand()
-                
-                # ارسال کارت‌های دور اول دست جدید
+
+                # پیام کارت‌های دست قبل پاک و کارت‌های دور اول دست جدید ارسال می‌شود
+                messages = []
                 for player in game.players:
+                    old_message_id = game.player_chat_ids.pop(player.user_id, None)
+                    if old_message_id:
+                        context.application.create_task(
+                            delete_silently(context, player.user_id, old_message_id)
+                        )
                     cards_text = format_cards(player.cards)
                     teammate = game.get_teammate(player)
                     teammate_text = f"\n🤝 یار شما: {teammate.display_name}" if teammate else ""
-                    await context.bot.send_message(
+                    messages.append((
                         player.user_id,
                         f"🎴 **دست {game.hand_number} - کارت‌های دور اول**{teammate_text}\n\n"
                         f"🃏 ۵ کارت اولیه\n{cards_text}\n\n"
                         f"🏆 امتیازات کلی: تیم ۱ {game.team0_rounds} - {game.team1_rounds} تیم ۲\n\n"
-                        f"⏳ منتظر انتخاب حکم..."
-                    )
-                
+                        f"⏳ منتظر انتخاب حکم...",
+                        None
+                    ))
+                await send_hands(context, game, messages)
+
                 # ارسال کیبورد انتخاب حکم به حاکم جدید
                 chooser = game.get_player(game.trump_chooser_id)
                 if chooser:
-                    keyboard = [
-                        [
-                            InlineKeyboardButton("♥️ دل", callback_data=f"trump:{game.game_id}:hearts"),
-                            InlineKeyboardButton("♦️ خشت", callback_data=f"trump:{game.game_id}:diamonds")
-                        ],
-                        [
-                            InlineKeyboardButton("♣️ گیشنیز", callback_data=f"trump:{game.game_id}:clubs"),
-                            InlineKeyboardButton("♠️ پیک", callback_data=f"trump:{game.game_id}:spades")
-                        ]
-                    ]
-                    await context.bot.send_message(
+                    await tg_call(lambda: context.bot.send_message(
                         chooser.user_id,
                         f"👑 **دست {game.hand_number} - شما انتخاب کننده حکم هستید!**\n\n"
-                        f"🔢 کد بازی: {game.game_id[-6:]}\n"
+                        f"🔢 کد بازی: {game.short_code}\n"
                         f"{game._teams_info()}\n"
                         f"🏆 امتیازات کلی: تیم ۱ {game.team0_rounds} - {game.team1_rounds} تیم ۲\n"
                         f"👇 لطفاً خال حکم را انتخاب کنید:",
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-            
+                        reply_markup=game.trump_markup
+                    ))
+
             # پایان بازی نهایی
             elif game.state == "finished":
                 team0 = [p for p in game.players if p.team == 0]
                 team1 = [p for p in game.players if p.team == 1]
                 team0_names = " و ".join(p.display_name for p in team0)
                 team1_names = " و ".join(p.display_name for p in team1)
-                
+
+                final_names = team0_names if game.team0_rounds >= 7 else team1_names
+                final_rounds = game.team0_rounds if game.team0_rounds >= 7 else game.team1_rounds
+                final_text = (
+                    f"🏆 **بازی تمام شد!**\n\n"
+                    f"🎯 تیم {final_names} با {final_rounds} دست به ۷ دست رسیدند!\n"
+                    f"🏅 **برنده نهایی بازی:** {final_names}\n"
+                    f"🎉 تبریک به قهرمانان!\n\n"
+                    f"📊 **نتیجه نهایی:**\n"
+                    f"{team0_names}: {game.team0_rounds} دست\n"
+                    f"{team1_names}: {game.team1_rounds} دست"
+                )
+                await send_to_many(context, [(p.user_id, final_text, None) for p in game.players])
                 for p in game.players:
-                    if game.team0_rounds >= 7:
-                        await context.bot.send_message(
-                            p.user_id,
-                            f"🏆 **بازی تمام شد!**\n\n"
-                            f"🎯 تیم {team0_names} با {game.team0_rounds} دست به ۷ دست رسیدند!\n"
-                            f"🏅 **برنده نهایی بازی:** {team0_names}\n"
-                            f"🎉 تبریک به قهرمانان!\n\n"
-                            f"📊 **نتیجه نهایی:**\n"
-                            f"{team0_names}: {game.team0_rounds} دست\n"
-                            f"{team1_names}: {game.team1_rounds} دست"
-                        )
-                    elif game.team1_rounds >= 7:
-                        await context.bot.send_message(
-                            p.user_id,
-                            f"🏆 **بازی تمام شد!**\n\n"
-                            f"🎯 تیم {team1_names} با {game.team1_rounds} دست به ۷ دست رسیدند!\n"
-                            f"🏅 **برنده نهایی بازی:** {team1_names}\n"
-                            f"🎉 تبریک به قهرمانان!\n\n"
-                            f"📊 **نتیجه نهایی:**\n"
-                            f"{team0_names}: {game.team0_rounds} دست\n"
-                            f"{team1_names}: {game.team1_rounds} دست"
-                        )
                     game_manager.remove_user_game(p.user_id)
                 game_manager.delete_game(game.game_id)
-                
+
         else:
             await query.answer(f"❌ {error}", show_alert=True)
 
+# پیشوند callback_data -> هندلر؛ هر کلیک با یک جستجوی دیکشنری مسیر‌یابی می‌شود
+CALLBACK_HANDLERS: Dict[str, Callable[..., Awaitable[None]]] = {
+    "verify": _callback_verify,
+    "trump": _callback_trump,
+    "play": _callback_play,
+}
+
+async def private_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    prefix, _, rest = query.data.partition(":")
+    handler = CALLBACK_HANDLERS.get(prefix)
+    if handler:
+        # هر هندلر پیش از اولین درخواست شبکه دقیقاً یک بار query.answer را صدا می‌زند
+        await handler(query, context, rest)
+    else:
+        await query.answer()
+
 # ==================== چت درون‌بازی ====================
 async def private_chat_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.id < 0:
@@ -1158,47 +1475,64 @@ async def private_chat_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     
     for other in game.players:
         if other.user_id != user.id:
-            try:
-                await context.bot.send_message(
-                    other.user_id,
-                    f"💬 {full_name}: {message_text}"
-                )
-            except:
-                pass
+            await send_silently(context, other.user_id, f"💬 {full_name}: {message_text}")
 
 # ==================== راه‌اندازی ====================
 def main():
-    print("=" * 60)
-    print("🤖 ربات پاسور - نسخه نهایی")
-    print(f"📢 کانال اجباری: {REQUIRED_CHANNEL}")
-    print("✅ 52 کارت منحصر به فرد - بدون تکرار")
-    print("✅ 5 کارت اول ثابت + 8 کارت بعد از حکم")
-    print("✅ تیم‌بندی درست (بازیکنان روبه‌رو)")
-    print("✅ هر دست = 1 مسابقه ۷ امتیازی")
-    print("✅ ۷ دست = برنده نهایی بازی")
-    print("✅ برنده دست = شروع کننده دست بعد")
-    print("✅ اعلام برنده دست و شروع خودکار دست بعد")
-    print("✅ لینک دعوت تا پایان بازی معتبر")
-    print("=" * 60)
-
-    app = Application.builder().token(TOKEN).build()
-
-    app.add_handler(CommandHandler("start", private_start))
-    app.add_handler(CommandHandler("newgame", newgame_command))
-    app.add_handler(CommandHandler("mygame", mygame_command))
-    app.add_handler(CommandHandler("startgame", startgame_command))
-    app.add_handler(CommandHandler("leave", leave_command))
-    app.add_handler(CommandHandler("close", close_command))
+    logger.info("🤖 ربات پاسور - کانال اجباری: %s", REQUIRED_CHANNEL)
+
+    app = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(True)
+        .connection_pool_size(256)
+        .get_updates_connection_pool_size(1)
+        .connect_timeout(5)
+        .read_timeout(10)
+        .write_timeout(10)
+        .pool_timeout(1.0)
+        .http_version("2")
+        # سقف سراسری ۳۰ درخواست در ثانیه؛ تکرار پس از 429 با tg_call است
+        .rate_limiter(AIORateLimiter(overall_max_rate=30, group_max_rate=20, max_retries=0))
+        .post_init(start_janitor)
+        .post_shutdown(stop_janitor)
+        .build()
+    )
+
+    app.add_handler(CommandHandler("start", private_start, block=False))
+    app.add_handler(CommandHandler("newgame", newgame_command, block=False))
+    app.add_handler(CommandHandler("mygame", mygame_command, block=False))
+    app.add_handler(CommandHandler("startgame", startgame_command, block=False))
+    app.add_handler(CommandHandler("leave", leave_command, block=False))
+    app.add_handler(CommandHandler("close", close_command, block=False))
 
     app.add_handler(MessageHandler(
         filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE,
-        private_chat_handler
+        private_chat_handler,
+        block=False
     ))
 
-    app.add_handler(CallbackQueryHandler(private_callback_handler))
-
-    print("✅ ربات آماده است!")
-    app.run_polling(drop_pending_updates=True)
+    app.add_handler(CallbackQueryHandler(private_callback_handler, block=False))
+
+    logger.info("✅ ربات آماده است!")
+    allowed_updates = [Update.MESSAGE, Update.CALLBACK_QUERY]
+    if WEBHOOK_URL:
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=TOKEN,
+            webhook_url=f"{WEBHOOK_URL}/{TOKEN}",
+            allowed_updates=allowed_updates,
+            drop_pending_updates=True
+        )
+    else:
+        # long polling سمت سرور؛ فقط پیام و کلیک دکمه دریافت می‌شود
+        app.run_polling(
+            drop_pending_updates=True,
+            allowed_updates=allowed_updates,
+            poll_interval=0.0,
+            timeout=30
+        )
 
 if __name__ == "__main__":
     main()